@@ -2,10 +2,17 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Mapping
+
+# Copy of os.environ taken by load_config(), so each lookup is a plain dict.get.
+# Taken at load time rather than import time because main.py runs load_dotenv()
+# after this module is imported.
+_ENV_SNAPSHOT: Mapping[str, str] = {}
 
 
 def _get_env(name: str, default: str | None = None, required: bool = False) -> str:
-    v = os.getenv(name, default)
+    v = _ENV_SNAPSHOT.get(name, default)
     if required and (v is None or v.strip() == ""):
         raise ValueError(f"Missing required environment variable: {name}")
     return v  # type: ignore
@@ -20,6 +27,8 @@ class AzureConfig:
     deployment_low_cost: str
     deployment_high_quality: str
     deployment_low_latency: str
+    # gzip request bodies of at least this many bytes (0 disables)
+    request_gzip_min_bytes: int
 
 
 @dataclass(frozen=True)
@@ -37,6 +46,16 @@ class AppConfig:
     # routing settings
     hard_timeout_s: float
     enable_request_logging: bool
+    # size of the worker thread pool used for blocking SDK calls (boto3)
+    worker_threads: int
+    # low_latency: call both providers at once and keep the first success
+    race_low_latency: bool
+    # in-memory cache for repeated low-temperature requests
+    enable_response_cache: bool
+    response_cache_maxsize: int
+    response_cache_ttl_s: float
+    # tiktoken encoding for token estimates; empty uses the chars/4 heuristic
+    tokenizer_encoding: str
     # cost model (approx, adjust to taste)
     azure_cost_per_1k_input_usd: float
     azure_cost_per_1k_output_usd: float
@@ -44,12 +63,26 @@ class AppConfig:
     bedrock_cost_per_1k_output_usd: float
 
 
+@lru_cache(maxsize=1)
 def load_config() -> tuple[AppConfig, AzureConfig, BedrockConfig]:
+    """
+    Reads configuration from the environment once and caches it.
+    Call load_config.cache_clear() after changing env vars (e.g. in tests).
+    """
+    global _ENV_SNAPSHOT
+    _ENV_SNAPSHOT = dict(os.environ)
+
     app = AppConfig(
         env=_get_env("APP_ENV", "dev"),
         log_db_path=_get_env("LOG_DB_PATH", "./usage_logs.sqlite"),
         hard_timeout_s=float(_get_env("HARD_TIMEOUT_S", "20")),
         enable_request_logging=_get_env("ENABLE_REQUEST_LOGGING", "true").lower() == "true",
+        worker_threads=int(_get_env("WORKER_THREADS", "200")),
+        race_low_latency=_get_env("RACE_LOW_LATENCY", "false").lower() == "true",
+        enable_response_cache=_get_env("ENABLE_RESPONSE_CACHE", "true").lower() == "true",
+        response_cache_maxsize=int(_get_env("RESPONSE_CACHE_MAXSIZE", "10000")),
+        response_cache_ttl_s=float(_get_env("RESPONSE_CACHE_TTL_S", "300")),
+        tokenizer_encoding=_get_env("TOKENIZER_ENCODING", ""),
         azure_cost_per_1k_input_usd=float(_get_env("AZURE_COST_PER_1K_INPUT_USD", "0.00015")),
         azure_cost_per_1k_output_usd=float(_get_env("AZURE_COST_PER_1K_OUTPUT_USD", "0.00060")),
         bedrock_cost_per_1k_input_usd=float(_get_env("BEDROCK_COST_PER_1K_INPUT_USD", "0.00025")),
@@ -63,6 +96,7 @@ def load_config() -> tuple[AppConfig, AzureConfig, BedrockConfig]:
         deployment_low_cost=_get_env("AZURE_DEPLOYMENT_LOW_COST", required=True),
         deployment_high_quality=_get_env("AZURE_DEPLOYMENT_HIGH_QUALITY", required=True),
         deployment_low_latency=_get_env("AZURE_DEPLOYMENT_LOW_LATENCY", required=True),
+        request_gzip_min_bytes=int(_get_env("AZURE_REQUEST_GZIP_MIN_BYTES", "4096")),
     )
 
     bedrock = BedrockConfig(
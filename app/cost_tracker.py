@@ -1,22 +1,64 @@
 from __future__ import annotations
 
+import atexit
+import logging
 import sqlite3
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, Deque, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Optional tiktoken encoding, set via use_tokenizer() at startup. tiktoken is only
+# imported when an encoding is configured.
+_TOKENIZER: Any = None
+
+
+def use_tokenizer(encoding: Optional[str]) -> None:
+    """
+    Estimate tokens with a tiktoken encoding (e.g. "cl100k_base") instead of the
+    chars/4 heuristic. Pass None/"" to go back to the heuristic.
+
+    The encoding is loaded here, not on first use, so a missing tiktoken install or
+    a bad encoding name fails at startup instead of inside a request.
+    """
+    global _TOKENIZER
+    tokenizer = None
+    if encoding:
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ValueError(
+                f"TOKENIZER_ENCODING={encoding!r} requires tiktoken (pip install tiktoken)"
+            ) from e
+        tokenizer = tiktoken.get_encoding(encoding)
+    _TOKENIZER = tokenizer
+    _tiktoken_len.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def _tiktoken_len(text: str) -> int:
+    # encoding is O(n) and slow, so repeated texts are worth caching; kept small
+    # because the cache holds on to the strings themselves
+    return len(_TOKENIZER.encode(text, disallowed_special=()))
 
 
 def est_tokens(text: str) -> int:
     """
-    Lightweight token estimate: ~ 4 chars/token (rough), with floor.
+    Lightweight token estimate: ~ 4 chars/token (rough, rounded up), with floor.
     It's approximate but useful for cost tracking and comparisons.
     """
     if not text:
         return 0
-    return max(1, int(len(text) / 4))
+    if _TOKENIZER is not None:
+        return max(1, _tiktoken_len(text))
+    return max(1, (len(text) + 3) >> 2)
 
 
-@dataclass
+@dataclass(slots=True)
 class CostEstimate:
     input_tokens_est: int
     output_tokens_est: int
@@ -24,38 +66,71 @@ class CostEstimate:
     cost_est_usd: float
 
 
+_INSERT_SQL = """
+    INSERT INTO usage_logs (
+        ts, request_id, provider, model, task, priority,
+        input_tokens_est, output_tokens_est, total_tokens_est,
+        cost_est_usd, latency_ms, success, error
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
 class UsageLogger:
+    """
+    Writes usage rows to SQLite from a background thread.
+
+    A single connection is opened for the lifetime of the logger. log() only
+    buffers the row; the writer thread flushes the buffer every FLUSH_INTERVAL_S
+    (or as soon as FLUSH_BATCH_SIZE rows are waiting) and commits each batch in
+    one transaction, so the request path never waits on an fsync.
+    """
+
+    FLUSH_INTERVAL_S = 0.05
+    FLUSH_BATCH_SIZE = 100
+
     def __init__(self, db_path: str) -> None:
         self.db_path = db_path
+        self._lock = threading.Lock()  # guards the connection
+        self._buffer_lock = threading.Lock()
+        self._buffer: Deque[Tuple[Any, ...]] = deque()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
         self._init_db()
+        self._writer = threading.Thread(target=self._run, name="usage-logger", daemon=True)
+        self._writer.start()
+        # the writer is a daemon thread; make sure buffered rows survive a normal exit
+        atexit.register(self.close)
 
     def _init_db(self) -> None:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS usage_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ts INTEGER NOT NULL,
-                    request_id TEXT NOT NULL,
-                    provider TEXT NOT NULL,
-                    model TEXT NOT NULL,
-                    task TEXT NOT NULL,
-                    priority TEXT NOT NULL,
-                    input_tokens_est INTEGER NOT NULL,
-                    output_tokens_est INTEGER NOT NULL,
-                    total_tokens_est INTEGER NOT NULL,
-                    cost_est_usd REAL NOT NULL,
-                    latency_ms INTEGER NOT NULL,
-                    success INTEGER NOT NULL,
-                    error TEXT
-                );
-                """
-            )
-            con.commit()
-        finally:
-            con.close()
+        # The connection is created here but used from the writer thread.
+        # isolation_level=None leaves transaction control to _write_batch.
+        self._con = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        cur = self._con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL;")
+        cur.execute("PRAGMA synchronous=NORMAL;")
+        cur.execute("PRAGMA busy_timeout=5000;")
+        cur.execute("PRAGMA temp_store=MEMORY;")
+        cur.execute("PRAGMA cache_size=-20000;")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usage_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts INTEGER NOT NULL,
+                request_id TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                task TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                input_tokens_est INTEGER NOT NULL,
+                output_tokens_est INTEGER NOT NULL,
+                total_tokens_est INTEGER NOT NULL,
+                cost_est_usd REAL NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                success INTEGER NOT NULL,
+                error TEXT
+            );
+            """
+        )
 
     def log(
         self,
@@ -70,37 +145,135 @@ class UsageLogger:
         success: bool,
         error: Optional[str] = None,
     ) -> None:
-        con = sqlite3.connect(self.db_path)
+        self._buffer_rows(
+            [
+                self._row(
+                    request_id=request_id,
+                    provider=provider,
+                    model=model,
+                    task=task,
+                    priority=priority,
+                    estimate=estimate,
+                    latency_ms=latency_ms,
+                    success=success,
+                    error=error,
+                )
+            ]
+        )
+
+    def log_many(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Logs several records (each takes the same keyword arguments as log())
+        and guarantees they are committed in the same transaction.
+        """
+        if records:
+            self._buffer_rows([self._row(**r) for r in records])
+
+    @staticmethod
+    def _row(
+        *,
+        request_id: str,
+        provider: str,
+        model: str,
+        task: str,
+        priority: str,
+        estimate: CostEstimate,
+        latency_ms: int,
+        success: bool,
+        error: Optional[str] = None,
+    ) -> Tuple[Any, ...]:
+        return (
+            int(time.time()),
+            request_id,
+            provider,
+            model,
+            task,
+            priority,
+            estimate.input_tokens_est,
+            estimate.output_tokens_est,
+            estimate.total_tokens_est,
+            estimate.cost_est_usd,
+            latency_ms,
+            1 if success else 0,
+            error,
+        )
+
+    def _buffer_rows(self, rows: List[Tuple[Any, ...]]) -> None:
+        # flush() swaps the whole buffer out under this lock, so rows added
+        # together always land in the same batch
+        with self._buffer_lock:
+            closed = self._closed.is_set()
+            if not closed:
+                self._buffer.extend(rows)
+                full = len(self._buffer) >= self.FLUSH_BATCH_SIZE
+        if closed:
+            # nothing will flush the buffer any more (e.g. a request served after
+            # the lifespan shut down), so commit on the caller's thread instead
+            self._write_after_close(rows)
+        elif full:
+            self._wake.set()
+
+    def flush(self) -> None:
+        """Write everything currently buffered, on the calling thread."""
+        with self._buffer_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, deque()
+        self._write_batch(rows)
+
+    def close(self) -> None:
+        """
+        Stop the writer thread, flush pending rows and close the connection.
+        Rows logged after this are written synchronously.
+        """
+        # set under the buffer lock so every row is either buffered before the
+        # final flush below or takes the synchronous path in _buffer_rows
+        with self._buffer_lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        with self._lock:
+            self._con.close()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(self.FLUSH_INTERVAL_S)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # usage logging must never take the gateway down; drop the batch
+                logger.exception("Dropped a batch of usage log rows")
+
+    def _write_batch(self, rows: Deque[Tuple[Any, ...]]) -> None:
+        with self._lock:
+            self._commit(self._con, rows)
+
+    def _write_after_close(self, rows: List[Tuple[Any, ...]]) -> None:
+        # the shared connection is closed by now; use a short-lived one
+        con = sqlite3.connect(self.db_path, isolation_level=None)
         try:
-            cur = con.cursor()
-            cur.execute(
-                """
-                INSERT INTO usage_logs (
-                    ts, request_id, provider, model, task, priority,
-                    input_tokens_est, output_tokens_est, total_tokens_est,
-                    cost_est_usd, latency_ms, success, error
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-                """,
-                (
-                    int(time.time()),
-                    request_id,
-                    provider,
-                    model,
-                    task,
-                    priority,
-                    estimate.input_tokens_est,
-                    estimate.output_tokens_est,
-                    estimate.total_tokens_est,
-                    estimate.cost_est_usd,
-                    latency_ms,
-                    1 if success else 0,
-                    error,
-                ),
-            )
-            con.commit()
+            con.execute("PRAGMA busy_timeout=5000;")
+            self._commit(con, rows)
         finally:
             con.close()
 
+    @staticmethod
+    def _commit(con: sqlite3.Connection, rows: Iterable[Tuple[Any, ...]]) -> None:
+        con.execute("BEGIN IMMEDIATE;")
+        try:
+            con.executemany(_INSERT_SQL, rows)
+            con.execute("COMMIT;")
+        except BaseException:
+            # a failed COMMIT can leave the transaction open; without this every
+            # later BEGIN fails with "cannot start a transaction within a transaction"
+            if con.in_transaction:
+                con.execute("ROLLBACK;")
+            raise
+
 
 def estimate_cost(
     *,
@@ -109,8 +282,10 @@ def estimate_cost(
     output_text: str,
     cost_per_1k_input_usd: float,
     cost_per_1k_output_usd: float,
+    prompt_tokens: Optional[int] = None,
 ) -> CostEstimate:
-    in_tok = est_tokens(prompt)
+    """Pass prompt_tokens when the caller has already estimated the prompt."""
+    in_tok = est_tokens(prompt) if prompt_tokens is None else prompt_tokens
     out_tok = est_tokens(output_text)
     total = in_tok + out_tok
     cost = (in_tok / 1000.0) * cost_per_1k_input_usd + (out_tok / 1000.0) * cost_per_1k_output_usd
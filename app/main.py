@@ -1,19 +1,45 @@
 from __future__ import annotations
 
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict
+
+import anyio.to_thread
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from .models import GenerateRequest, GenerateResponse
 from .config import load_config
 from .providers.azure_openai import AzureOpenAIProvider
 from .providers.aws_bedrock import AwsBedrockProvider
-from .cost_tracker import UsageLogger
+from .providers.base import LLMProvider
+from .cost_tracker import UsageLogger, use_tokenizer
+from .response_cache import ResponseCache
 from .router import run_generation
 from dotenv import load_dotenv
 load_dotenv()
 
 
-app = FastAPI(title="GenAI Cloud Gateway", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bedrock calls run on anyio's thread pool (default 40 threads), which would
+    # otherwise cap concurrent Bedrock requests well below what the loop can handle.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = APP_CFG.worker_threads
+    yield
+    for provider in list(_providers.values()):
+        await provider.aclose()
+    # drain queued usage rows before the process exits
+    usage_logger.close()
+
+
+app = FastAPI(
+    title="GenAI Cloud Gateway",
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes the /generate payload (nested attempts, long text) much faster
+    default_response_class=ORJSONResponse,
+)
 
 # CORS: adjust as needed
 app.add_middleware(
@@ -26,13 +52,42 @@ app.add_middleware(
 
 APP_CFG, AZURE_CFG, BEDROCK_CFG = load_config()
 usage_logger = UsageLogger(APP_CFG.log_db_path)
-
-azure_provider = AzureOpenAIProvider(
-    endpoint=AZURE_CFG.endpoint,
-    api_key=AZURE_CFG.api_key,
-    api_version=AZURE_CFG.api_version,
+use_tokenizer(APP_CFG.tokenizer_encoding)
+response_cache = (
+    ResponseCache(maxsize=APP_CFG.response_cache_maxsize, ttl_s=APP_CFG.response_cache_ttl_s)
+    if APP_CFG.enable_response_cache
+    else None
 )
-bedrock_provider = AwsBedrockProvider(region=BEDROCK_CFG.region)
+
+
+# Providers are built the first time the router picks them, so importing the app
+# (or serving Azure-only traffic) doesn't pay for the SDKs.
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def _build_provider(name: str) -> LLMProvider:
+    # runs on a worker thread; the lock stops concurrent first requests building twice
+    with _providers_lock:
+        if name not in _providers:
+            if name == "azure":
+                _providers[name] = AzureOpenAIProvider(
+                    endpoint=AZURE_CFG.endpoint,
+                    api_key=AZURE_CFG.api_key,
+                    api_version=AZURE_CFG.api_version,
+                    gzip_min_bytes=AZURE_CFG.request_gzip_min_bytes,
+                )
+            else:
+                _providers[name] = AwsBedrockProvider(region=BEDROCK_CFG.region)
+        return _providers[name]
+
+
+async def get_provider(name: str) -> LLMProvider:
+    provider = _providers.get(name)
+    if provider is None:
+        # importing boto3/httpx and building the client blocks; keep it off the event loop
+        provider = await anyio.to_thread.run_sync(_build_provider, name)
+    return provider
 
 
 @app.get("/health")
@@ -41,16 +96,16 @@ def health():
 
 
 @app.post("/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest):
+async def generate(req: GenerateRequest):
     try:
-        result = run_generation(
+        result = await run_generation(
             app_cfg=APP_CFG,
             azure_cfg=AZURE_CFG,
             bedrock_cfg=BEDROCK_CFG,
             req=req,
-            azure_provider=azure_provider,
-            bedrock_provider=bedrock_provider,
+            get_provider=get_provider,
             usage_logger=usage_logger,
+            response_cache=response_cache,
         )
         return result
     except Exception as e:
@@ -45,3 +45,4 @@ class GenerateResponse(BaseModel):
     latency_ms: int
     fallback_used: bool
     attempts: List[ProviderResponse]
+    cached: bool = Field(False, description="True when served from the response cache")
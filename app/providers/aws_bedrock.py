@@ -1,19 +1,28 @@
 from __future__ import annotations
 
-import json
 import time
-from typing import Dict, Any, Optional
+from functools import partial
 
-import boto3
-from botocore.config import Config as BotoConfig
+import anyio
+import orjson
 
 from .base import ProviderResult
 
+# invoke_model body for Claude-style messages, filled in per request (see generate()).
+_BODY_TEMPLATE = (
+    b'{"anthropic_version":"bedrock-2023-05-31","max_tokens":%d,"temperature":%s,"top_p":%s,'
+    b'"messages":[{"role":"user","content":[{"type":"text","text":%s}]}]}'
+)
+
 
 class AwsBedrockProvider:
     provider_name = "bedrock"
 
     def __init__(self, *, region: str) -> None:
+        # imported here: boto3/botocore load slowly and only this provider needs them
+        import boto3
+        from botocore.config import Config as BotoConfig
+
         # bedrock runtime client
         self.client = boto3.client(
             "bedrock-runtime",
@@ -21,7 +30,17 @@ class AwsBedrockProvider:
             config=BotoConfig(retries={"max_attempts": 2, "mode": "standard"}),
         )
 
-    def generate(
+    async def aclose(self) -> None:
+        # boto3 clients hold no resources that need an explicit close
+        return None
+
+    def _invoke(self, *, model_id: str, body: bytes) -> bytes:
+        # The response body is a stream, so read() blocks on the socket too;
+        # both run on the worker thread.
+        response = self.client.invoke_model(modelId=model_id, body=body)
+        return response["body"].read()
+
+    async def generate(
         self,
         *,
         prompt: str,
@@ -31,6 +50,7 @@ class AwsBedrockProvider:
         temperature: float,
         top_p: float,
         timeout_s: float,
+        return_raw: bool = False,
     ) -> ProviderResult:
         """
         Uses Bedrock 'invoke_model'. Payload format differs per model.
@@ -44,31 +64,27 @@ class AwsBedrockProvider:
           "top_p": ...,
           "messages": [{"role":"user","content":[{"type":"text","text":"..."}]}]
         }
+
+        boto3 is blocking (including reading the streamed response body), so both run on
+        anyio's worker thread pool to keep the event loop free (pool size is set at
+        startup, see WORKER_THREADS).
         """
-        body: Dict[str, Any] = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_output_tokens,
-            "temperature": temperature,
-            "top_p": top_p,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"{system_prompt}\n\n{prompt}".strip()}
-                    ],
-                }
-            ],
-        }
+        # Only the text needs JSON escaping; the numbers are range-checked floats/ints
+        # whose repr is valid JSON.
+        body = _BODY_TEMPLATE % (
+            max_output_tokens,
+            repr(float(temperature)).encode(),
+            repr(float(top_p)).encode(),
+            orjson.dumps(f"{system_prompt}\n\n{prompt}".strip()),
+        )
 
-        start = time.perf_counter()
-        response = self.client.invoke_model(
-            modelId=model_or_deployment,
-            body=json.dumps(body).encode("utf-8"),
+        start = time.perf_counter_ns()
+        raw_bytes = await anyio.to_thread.run_sync(
+            partial(self._invoke, model_id=model_or_deployment, body=body)
         )
-        latency_ms = int((time.perf_counter() - start) * 1000)
+        latency_ms = (time.perf_counter_ns() - start) // 1_000_000
 
-        raw_bytes = response.get("body").read()
-        data = json.loads(raw_bytes.decode("utf-8"))
+        data = orjson.loads(raw_bytes)
 
         # Claude commonly returns: {"content":[{"type":"text","text":"..."}], ...}
         text = ""
@@ -90,5 +106,6 @@ class AwsBedrockProvider:
             model=model_or_deployment,
             text=text,
             latency_ms=latency_ms,
-            raw=data if isinstance(data, dict) else None,
+            # only keep the parsed body when asked; otherwise it's freed on return
+            raw=data if return_raw and isinstance(data, dict) else None,
         )
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import gzip
 import time
 from typing import Dict, Any, Optional
 
-import httpx
+import orjson
 
 from .base import ProviderResult
 
@@ -11,12 +12,39 @@ from .base import ProviderResult
 class AzureOpenAIProvider:
     provider_name = "azure"
 
-    def __init__(self, *, endpoint: str, api_key: str, api_version: str) -> None:
+    def __init__(
+        self,
+        *,
+        endpoint: str,
+        api_key: str,
+        api_version: str,
+        gzip_min_bytes: int = 4096,
+    ) -> None:
+        # imported here so the app can start without paying for httpx until Azure is used
+        import httpx
+
         self.endpoint = endpoint.rstrip("/")
         self.api_key = api_key
         self.api_version = api_version
+        # request bodies at least this large are sent gzip-compressed; 0 disables
+        self.gzip_min_bytes = gzip_min_bytes
+        # per-deployment URLs and fixed headers, built once instead of per request
+        self._url_cache: Dict[str, str] = {}
+        self._headers = httpx.Headers({"api-key": api_key, "Content-Type": "application/json"})
+        self._gzip_headers = httpx.Headers(
+            {"api-key": api_key, "Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        # Shared across requests so connections to the Azure endpoint stay warm
+        # (no TCP+TLS handshake per call). Timeouts are applied per request.
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        )
 
-    def generate(
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def generate(
         self,
         *,
         prompt: str,
@@ -26,20 +54,19 @@ class AzureOpenAIProvider:
         temperature: float,
         top_p: float,
         timeout_s: float,
+        return_raw: bool = False,
     ) -> ProviderResult:
         """
         Uses Azure OpenAI Chat Completions REST API:
         POST {endpoint}/openai/deployments/{deployment}/chat/completions?api-version=...
         """
-        url = (
-            f"{self.endpoint}/openai/deployments/{model_or_deployment}/chat/completions"
-            f"?api-version={self.api_version}"
-        )
-
-        headers = {
-            "api-key": self.api_key,
-            "Content-Type": "application/json",
-        }
+        url = self._url_cache.get(model_or_deployment)
+        if url is None:
+            url = self._url_cache.setdefault(
+                model_or_deployment,
+                f"{self.endpoint}/openai/deployments/{model_or_deployment}/chat/completions"
+                f"?api-version={self.api_version}",
+            )
 
         payload: Dict[str, Any] = {
             "messages": [
@@ -51,15 +78,21 @@ class AzureOpenAIProvider:
             "top_p": top_p,
         }
 
-        start = time.perf_counter()
-        with httpx.Client(timeout=timeout_s) as client:
-            resp = client.post(url, headers=headers, json=payload)
-            latency_ms = int((time.perf_counter() - start) * 1000)
+        body = orjson.dumps(payload)
+        headers = self._headers
+        if self.gzip_min_bytes and len(body) >= self.gzip_min_bytes:
+            # long summarise/rewrite prompts compress well; fewer bytes on the uplink
+            body = gzip.compress(body, compresslevel=5)
+            headers = self._gzip_headers
+
+        start = time.perf_counter_ns()
+        resp = await self.client.post(url, headers=headers, content=body, timeout=timeout_s)
+        latency_ms = (time.perf_counter_ns() - start) // 1_000_000
 
         if resp.status_code >= 400:
             raise RuntimeError(f"Azure OpenAI error {resp.status_code}: {resp.text}")
 
-        data = resp.json()
+        data = orjson.loads(resp.content)
         text = ""
         try:
             text = data["choices"][0]["message"]["content"]
@@ -71,5 +104,6 @@ class AzureOpenAIProvider:
             model=model_or_deployment,
             text=text,
             latency_ms=latency_ms,
-            raw=data if isinstance(data, dict) else None,
+            # only keep the parsed body when asked; otherwise it's freed on return
+            raw=data if return_raw and isinstance(data, dict) else None,
         )
@@ -16,7 +16,7 @@ class ProviderResult:
 class LLMProvider(Protocol):
     provider_name: str
 
-    def generate(
+    async def generate(
         self,
         *,
         prompt: str,
@@ -26,5 +26,11 @@ class LLMProvider(Protocol):
         temperature: float,
         top_p: float,
         timeout_s: float,
+        return_raw: bool = False,
     ) -> ProviderResult:
+        """Set return_raw=True to keep the parsed provider response on ProviderResult.raw."""
+        ...
+
+    async def aclose(self) -> None:
+        """Release any network resources held by the provider."""
         ...
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import threading
+from hashlib import blake2b
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+from .models import GenerateRequest
+
+
+class ResponseCache:
+    """
+    In-memory TTL/LRU cache of /generate results for near-deterministic requests.
+    Requests with temperature above MAX_TEMPERATURE are never cached, since
+    callers asking for sampling expect a fresh completion each time.
+    """
+
+    MAX_TEMPERATURE = 0.1
+
+    def __init__(self, *, maxsize: int, ttl_s: float) -> None:
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_s)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def key_for(cls, req: GenerateRequest) -> Optional[Tuple[Any, ...]]:
+        """Cache key for a request, or None if the request shouldn't be cached."""
+        if req.temperature > cls.MAX_TEMPERATURE:
+            return None
+        return (
+            blake2b(req.prompt.encode("utf-8"), digest_size=16).hexdigest(),
+            req.task,
+            req.priority,
+            req.max_output_tokens,
+            round(req.temperature, 2),
+            round(req.top_p, 2),
+            req.provider_hint,
+        )
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._cache.get(key)
+
+    def put(self, key: Tuple[Any, ...], result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[key] = result
@@ -1,31 +1,42 @@
 from __future__ import annotations
 
-import uuid
-from typing import Tuple, List, Dict, Any
+import asyncio
+import os
+from types import MappingProxyType
+from typing import Awaitable, Callable, Tuple, List, Dict, Any, Optional
 
-from .models import GenerateRequest, ProviderResponse
-from .providers.azure_openai import AzureOpenAIProvider
-from .providers.aws_bedrock import AwsBedrockProvider
-from .cost_tracker import estimate_cost, UsageLogger
+from .models import GenerateRequest
+from .cost_tracker import CostEstimate, est_tokens, estimate_cost, UsageLogger
 from .config import AppConfig, AzureConfig, BedrockConfig
+from .providers.base import LLMProvider
+from .response_cache import ResponseCache
+
+
+_BASE_SYSTEM_PROMPT = (
+    "You are a helpful enterprise assistant. "
+    "Be concise, correct, and safe. "
+    "If the user requests sensitive personal data, refuse. "
+    "If uncertain, say you are uncertain and ask a short clarifying question."
+)
+
+_TASK_HINTS = {
+    "summarise": "Summarise the input in bullet points, capturing key facts and decisions.",
+    "extract": "Extract key entities/fields as JSON. If a field is missing, set it to null.",
+    "classify": "Classify the input into a small set of labels and explain briefly.",
+    "rewrite": "Rewrite for clarity and professionalism without changing meaning.",
+    "qa": "Answer the question using the provided text. If missing context, say so.",
+    "chat": "Respond naturally and helpfully.",
+}
+
+# Built once at import (read-only); prompts don't change between requests.
+_SYSTEM_PROMPTS = MappingProxyType(
+    {task: f"{_BASE_SYSTEM_PROMPT}\n\nTask: {hint}" for task, hint in _TASK_HINTS.items()}
+)
+_DEFAULT_SYSTEM_PROMPT = _SYSTEM_PROMPTS["chat"]
 
 
 def build_system_prompt(task: str) -> str:
-    base = (
-        "You are a helpful enterprise assistant. "
-        "Be concise, correct, and safe. "
-        "If the user requests sensitive personal data, refuse. "
-        "If uncertain, say you are uncertain and ask a short clarifying question."
-    )
-    task_hints = {
-        "summarise": "Summarise the input in bullet points, capturing key facts and decisions.",
-        "extract": "Extract key entities/fields as JSON. If a field is missing, set it to null.",
-        "classify": "Classify the input into a small set of labels and explain briefly.",
-        "rewrite": "Rewrite for clarity and professionalism without changing meaning.",
-        "qa": "Answer the question using the provided text. If missing context, say so.",
-        "chat": "Respond naturally and helpfully.",
-    }
-    return f"{base}\n\nTask: {task_hints.get(task, task_hints['chat'])}"
+    return _SYSTEM_PROMPTS.get(task) or _DEFAULT_SYSTEM_PROMPT
 
 
 def choose_models(req: GenerateRequest, azure: AzureConfig, bedrock: BedrockConfig) -> Tuple[Tuple[str, str], Tuple[str, str]]:
@@ -61,149 +72,197 @@ def choose_models(req: GenerateRequest, azure: AzureConfig, bedrock: BedrockConf
     return primary, secondary
 
 
-def run_generation(
+async def run_generation(
     *,
     app_cfg: AppConfig,
     azure_cfg: AzureConfig,
     bedrock_cfg: BedrockConfig,
     req: GenerateRequest,
-    azure_provider: AzureOpenAIProvider,
-    bedrock_provider: AwsBedrockProvider,
+    get_provider: Callable[[str], Awaitable[LLMProvider]],
     usage_logger: UsageLogger,
+    response_cache: Optional[ResponseCache] = None,
 ) -> Dict[str, Any]:
-    request_id = str(uuid.uuid4())
+    request_id = os.urandom(16).hex()
+
+    cache_key = response_cache.key_for(req) if response_cache is not None else None
+    if cache_key is not None:
+        hit = response_cache.get(cache_key)
+        if hit is not None:
+            # No provider was called for this request, so it reports no attempts
+            # (and therefore no per-attempt cost or latency).
+            return {**hit, "request_id": request_id, "latency_ms": 0, "attempts": [], "cached": True}
+
     system_prompt = build_system_prompt(req.task)
     primary, secondary = choose_models(req, azure_cfg, bedrock_cfg)
 
-    attempts: List[ProviderResponse] = []
+    # Plain dicts shaped like ProviderResponse; FastAPI validates the final
+    # payload against GenerateResponse once, so no per-attempt model round-trip.
+    attempts: List[Dict[str, Any]] = []
     fallback_used = False
+    # usage rows for this request, written together in one transaction at the end
+    log_records: List[Dict[str, Any]] = []
+    # estimated once; every attempt and failure row reuses it
+    prompt_tokens = est_tokens(req.prompt)
 
-    def call(provider_name: str, model_id: str) -> ProviderResponse:
+    def estimate_for(provider_name: str, output_text: str) -> CostEstimate:
         if provider_name == "azure":
-            result = azure_provider.generate(
-                prompt=req.prompt,
-                system_prompt=system_prompt,
-                model_or_deployment=model_id,
-                max_output_tokens=req.max_output_tokens,
-                temperature=req.temperature,
-                top_p=req.top_p,
-                timeout_s=app_cfg.hard_timeout_s,
-            )
-            est = estimate_cost(
+            return estimate_cost(
                 provider="azure",
                 prompt=req.prompt,
-                output_text=result.text,
+                output_text=output_text,
                 cost_per_1k_input_usd=app_cfg.azure_cost_per_1k_input_usd,
                 cost_per_1k_output_usd=app_cfg.azure_cost_per_1k_output_usd,
+                prompt_tokens=prompt_tokens,
             )
-        else:
-            result = bedrock_provider.generate(
-                prompt=req.prompt,
-                system_prompt=system_prompt,
-                model_or_deployment=model_id,
-                max_output_tokens=req.max_output_tokens,
-                temperature=req.temperature,
-                top_p=req.top_p,
-                timeout_s=app_cfg.hard_timeout_s,
-            )
-            est = estimate_cost(
-                provider="bedrock",
-                prompt=req.prompt,
-                output_text=result.text,
-                cost_per_1k_input_usd=app_cfg.bedrock_cost_per_1k_input_usd,
-                cost_per_1k_output_usd=app_cfg.bedrock_cost_per_1k_output_usd,
-            )
+        return estimate_cost(
+            provider="bedrock",
+            prompt=req.prompt,
+            output_text=output_text,
+            cost_per_1k_input_usd=app_cfg.bedrock_cost_per_1k_input_usd,
+            cost_per_1k_output_usd=app_cfg.bedrock_cost_per_1k_output_usd,
+            prompt_tokens=prompt_tokens,
+        )
+
+    async def call(provider_name: str, model_id: str) -> Dict[str, Any]:
+        # resolved here so a provider is only built once the router actually picks it
+        provider = await get_provider(provider_name)
+        result = await provider.generate(
+            prompt=req.prompt,
+            system_prompt=system_prompt,
+            model_or_deployment=model_id,
+            max_output_tokens=req.max_output_tokens,
+            temperature=req.temperature,
+            top_p=req.top_p,
+            timeout_s=app_cfg.hard_timeout_s,
+        )
+        est = estimate_for(provider_name, result.text)
 
         # log success
         if app_cfg.enable_request_logging:
-            usage_logger.log(
-                request_id=request_id,
-                provider=provider_name,
-                model=model_id,
-                task=req.task,
-                priority=req.priority,
-                estimate=est,
-                latency_ms=result.latency_ms,
-                success=True,
-                error=None,
+            log_records.append(
+                dict(
+                    request_id=request_id,
+                    provider=provider_name,
+                    model=model_id,
+                    task=req.task,
+                    priority=req.priority,
+                    estimate=est,
+                    latency_ms=result.latency_ms,
+                    success=True,
+                    error=None,
+                )
             )
 
-        return ProviderResponse(
-            provider=provider_name,  # type: ignore
-            model=model_id,
-            text=result.text,
-            latency_ms=result.latency_ms,
-            usage={
+        return {
+            "provider": provider_name,
+            "model": model_id,
+            "text": result.text,
+            "latency_ms": result.latency_ms,
+            "usage": {
                 "input_tokens_est": est.input_tokens_est,
                 "output_tokens_est": est.output_tokens_est,
                 "total_tokens_est": est.total_tokens_est,
                 "cost_est_usd": est.cost_est_usd,
             },
-            raw=None,  # keep responses lean; set to result.raw if you want debugging
-        )
+            "raw": None,  # keep responses lean; generate(return_raw=True) exposes result.raw for debugging
+        }
 
-    # Try primary
-    try:
-        pr = call(primary[0], primary[1])
-        attempts.append(pr)
-        chosen = pr
-    except Exception as e1:
-        # log failure primary
-        if app_cfg.enable_request_logging:
+    def log_failure(target: Tuple[str, str], error: str, est: Optional[CostEstimate] = None) -> None:
+        if not app_cfg.enable_request_logging:
+            return
+        if est is None:
             # estimate cost with empty output
-            from .cost_tracker import CostEstimate, est_tokens
             est = CostEstimate(
-                input_tokens_est=est_tokens(req.prompt),
+                input_tokens_est=prompt_tokens,
                 output_tokens_est=0,
-                total_tokens_est=est_tokens(req.prompt),
+                total_tokens_est=prompt_tokens,
                 cost_est_usd=0.0,
             )
-            usage_logger.log(
+        log_records.append(
+            dict(
                 request_id=request_id,
-                provider=primary[0],
-                model=primary[1],
+                provider=target[0],
+                model=target[1],
                 task=req.task,
                 priority=req.priority,
                 estimate=est,
                 latency_ms=0,
                 success=False,
-                error=str(e1)[:500],
+                error=error[:500],
             )
+        )
 
-        # Try secondary
-        fallback_used = True
-        try:
-            sr = call(secondary[0], secondary[1])
-            attempts.append(sr)
-            chosen = sr
-        except Exception as e2:
-            if app_cfg.enable_request_logging:
-                from .cost_tracker import CostEstimate, est_tokens
-                est = CostEstimate(
-                    input_tokens_est=est_tokens(req.prompt),
-                    output_tokens_est=0,
-                    total_tokens_est=est_tokens(req.prompt),
-                    cost_est_usd=0.0,
-                )
-                usage_logger.log(
-                    request_id=request_id,
-                    provider=secondary[0],
-                    model=secondary[1],
-                    task=req.task,
-                    priority=req.priority,
-                    estimate=est,
-                    latency_ms=0,
-                    success=False,
-                    error=str(e2)[:500],
+    try:
+        if req.priority == "low_latency" and app_cfg.race_low_latency:
+            # Race both providers; the first success wins and the other call is cancelled.
+            tasks = {
+                asyncio.create_task(call(primary[0], primary[1])): primary,
+                asyncio.create_task(call(secondary[0], secondary[1])): secondary,
+            }
+            pending = set(tasks)
+            errors: Dict[Tuple[str, str], BaseException] = {}
+            chosen = None
+            try:
+                while pending and chosen is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    # if both finish together, prefer the primary
+                    for t in sorted(done, key=lambda t: tasks[t] != primary):
+                        exc = t.exception()
+                        if exc is not None:
+                            errors[tasks[t]] = exc
+                            log_failure(tasks[t], str(exc))
+                            continue
+                        attempts.append(t.result())
+                        if chosen is None:
+                            chosen = t.result()
+                            fallback_used = tasks[t] == secondary
+            finally:
+                for t in pending:
+                    t.cancel()
+                    # The loser is still billed (a Bedrock call on a worker thread can't
+                    # be aborted), so record it with the input-side cost estimate.
+                    log_failure(
+                        tasks[t],
+                        "cancelled: lost low_latency race" if chosen is not None else "cancelled",
+                        est=estimate_for(tasks[t][0], ""),
+                    )
+
+            if chosen is None:
+                raise RuntimeError(
+                    f"Both providers failed. Primary: {errors.get(primary)}; Secondary: {errors.get(secondary)}"
                 )
-            raise RuntimeError(f"Both providers failed. Primary: {e1}; Secondary: {e2}")
+        else:
+            # Try primary
+            try:
+                pr = await call(primary[0], primary[1])
+                attempts.append(pr)
+                chosen = pr
+            except Exception as e1:
+                # log failure primary
+                log_failure(primary, str(e1))
+
+                # Try secondary
+                fallback_used = True
+                try:
+                    sr = await call(secondary[0], secondary[1])
+                    attempts.append(sr)
+                    chosen = sr
+                except Exception as e2:
+                    log_failure(secondary, str(e2))
+                    raise RuntimeError(f"Both providers failed. Primary: {e1}; Secondary: {e2}")
+    finally:
+        usage_logger.log_many(log_records)
 
-    return {
+    response = {
         "request_id": request_id,
-        "chosen_provider": chosen.provider,
-        "chosen_model": chosen.model,
-        "text": chosen.text,
-        "latency_ms": chosen.latency_ms,
+        "chosen_provider": chosen["provider"],
+        "chosen_model": chosen["model"],
+        "text": chosen["text"],
+        "latency_ms": chosen["latency_ms"],
         "fallback_used": fallback_used,
-        "attempts": [a.model_dump() for a in attempts],
+        "attempts": attempts,
+        "cached": False,
     }
+    if cache_key is not None:
+        response_cache.put(cache_key, response)
+    return response